@@ -17,7 +17,10 @@ Features implemented per user request:
 - Mokugyo reduced in size so it doesn't overflow the play area
 - Robust fallbacks for missing assets; won't crash
 """
+import bisect
 import os, sys, math, random, time
+from enum import IntEnum
+from concurrent.futures import ThreadPoolExecutor
 import pygame
 
 # ----------------- Initialization -----------------
@@ -28,10 +31,18 @@ except Exception:
     pass
 
 WIDTH, HEIGHT = 1280, 720
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
+# Prefer the accelerated present path (GPU-scaled backbuffer + vsync); fall
+# back to a plain software window where the platform can't provide it.
+try:
+    screen = pygame.display.set_mode((WIDTH, HEIGHT), pygame.SCALED | pygame.DOUBLEBUF, vsync=1)
+except Exception:
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
 pygame.display.set_caption("木魚リズム — Final")
 clock = pygame.time.Clock()
 FPS = 60
+# Held keys are sampled via key.get_pressed() where continuous input is
+# wanted, so OS auto-repeat only produces redundant KEYDOWN bursts — off.
+pygame.key.set_repeat(0)
 
 ASSETS = "assets"
 
@@ -40,7 +51,12 @@ def now_s(): return pygame.time.get_ticks() / 1000.0
 def clamp(v, a, b): return max(a, min(b, v))
 
 # ----------------- Font loader -----------------
-def load_jp_font(size):
+# The candidate walk (and its throwaway glyph-check render) runs once; every
+# requested size then constructs straight from the cached source.
+_FONT_SOURCE = None  # ("file", path) or ("sys", name-or-None)
+
+def _probe_font_source():
+    global _FONT_SOURCE
     candidates = [
         os.path.join(ASSETS, "NotoSansJP-Regular.otf"),
         "Hiragino Kaku Gothic ProN",
@@ -51,14 +67,28 @@ def load_jp_font(size):
     for c in candidates:
         try:
             if isinstance(c, str) and os.path.exists(c):
-                return pygame.font.Font(c, size)
+                pygame.font.Font(c, 12)
+                _FONT_SOURCE = ("file", c)
+                return
             else:
-                f = pygame.font.SysFont(c, size)
-                _ = f.render("テスト", True, (0,0,0))
-                return f
+                f = pygame.font.SysFont(c, 12)
+                _ = f.render("テスト", True, (0,0,0))  # verify JP glyphs exist
+                _FONT_SOURCE = ("sys", c)
+                return
         except Exception:
             continue
-    return pygame.font.SysFont(None, size)
+    _FONT_SOURCE = ("sys", None)
+
+def load_jp_font(size):
+    if _FONT_SOURCE is None:
+        _probe_font_source()
+    kind, src = _FONT_SOURCE
+    if kind == "file":
+        try:
+            return pygame.font.Font(src, size)
+        except Exception:
+            pass
+    return pygame.font.SysFont(src if kind == "sys" else None, size)
 
 FONT_LG = load_jp_font(56)
 FONT_MD = load_jp_font(28)
@@ -66,17 +96,20 @@ FONT_SM = load_jp_font(20)
 FONT_BOLD = load_jp_font(24)
 
 # ----------------- Safe asset loaders -----------------
-def safe_image(name, scale=None, fallback=(80,80,80)):
+def safe_image(name, scale=None, fallback=(80,80,80), alpha=True):
+    # alpha=False picks the opaque convert() path — per-blit it's a straight
+    # copy instead of a per-pixel blend, which matters for full-screen images.
     p = os.path.join(ASSETS, name)
     if os.path.exists(p):
         try:
-            im = pygame.image.load(p).convert_alpha()
+            im = pygame.image.load(p)
+            im = im.convert_alpha() if alpha else im.convert()
             if scale: im = pygame.transform.smoothscale(im, scale)
             return im
         except Exception:
             pass
     w,h = scale if scale else (200,200)
-    s = pygame.Surface((w,h), pygame.SRCALPHA)
+    s = pygame.Surface((w,h), pygame.SRCALPHA) if alpha else pygame.Surface((w,h))
     s.fill(fallback)
     return s
 
@@ -90,7 +123,7 @@ def safe_sound(name):
     return None
 
 # ----------------- Assets -----------------
-BG_IMG = safe_image("bg_room.jpg", scale=(WIDTH, HEIGHT))
+BG_IMG = safe_image("bg_room.jpg", scale=(WIDTH, HEIGHT), alpha=False)
 # Mokugyo smaller to avoid overflow
 MOKUGYO_IMG = safe_image("mokugyo.png", scale=(100,100))
 HANNYA_IMG = safe_image("hannya.png", scale=(240,240))
@@ -108,8 +141,27 @@ if BGM:
 BPM = 158
 SPB = 60.0 / BPM             # seconds per quarter note
 NOTE_TRAVEL_SEC = 1.6        # spawn -> hit time, constant linear speed
+_INV_NOTE_TRAVEL_SEC = 1.0 / max(0.001, NOTE_TRAVEL_SEC)
 NOTE_RADIUS = 14
 
+# Every note is one of four identical circles (ghost/dummy combinations);
+# bake them once and blit instead of rasterizing a circle per note per frame.
+def _build_note_surfs():
+    colors = {
+        (False, False): (255,255,255),
+        (True, False):  (220,220,220),
+        (False, True):  (150,150,150),
+        (True, True):   (130,130,130),
+    }
+    surfs = {}
+    for key, col in colors.items():
+        s = pygame.Surface((2*NOTE_RADIUS+2, 2*NOTE_RADIUS+2), pygame.SRCALPHA)
+        pygame.draw.circle(s, col, (NOTE_RADIUS+1, NOTE_RADIUS+1), NOTE_RADIUS)
+        surfs[key] = s.convert_alpha()
+    return surfs
+
+NOTE_SURFS = _build_note_surfs()
+
 # Compute play area positions:
 # Previous play width (approx) used earlier was ~WIDTH*0.38, with right edge at WIDTH/2.
 # New requirement: move whole area left so left blank becomes ~1/3 of previous blank.
@@ -125,6 +177,20 @@ PLAY_AREA = pygame.Rect(NEW_LEFT_BLANK, 40, PLAY_WIDTH, int(HEIGHT * 0.86))
 LANE_X = int(PLAY_AREA.left + PLAY_AREA.width * 0.25)
 MOKUGYO_CENTER = (LANE_X, PLAY_AREA.bottom - 40)
 HITLINE_Y = PLAY_AREA.bottom - 120
+# every note travels the same vertical segment; keep it out of the instances
+NOTE_START_Y = -60
+NOTE_SPAN_Y = HITLINE_Y - NOTE_START_Y
+
+# The playfield border and hitline are fixed geometry (only the shake offset
+# moves them), so bake both into one transparent overlay blitted per frame.
+def _build_playfield_overlay():
+    surf = pygame.Surface(PLAY_AREA.size, pygame.SRCALPHA)
+    pygame.draw.rect(surf, (255,255,255), surf.get_rect(), width=4)
+    hl_y = HITLINE_Y - PLAY_AREA.top
+    pygame.draw.line(surf, (0,0,0), (8, hl_y), (PLAY_AREA.width - 8, hl_y), 4)
+    return surf.convert_alpha()
+
+PLAYFIELD_OVERLAY = _build_playfield_overlay()
 
 # Hannya area
 HANNYA_TARGET_X = int(WIDTH * 0.82)
@@ -141,21 +207,38 @@ MISS_LIMIT_MAP = {"easy":12, "normal":6, "hard":1}
 DIFF_WINDOW = {"easy":1.4, "normal":1.0, "hard":0.6}
 HIDE_STEP = 4
 
-# Effects durations
-effects = {
-    "shake_small": 0.0,
-    "shake_big": 0.0,
-    "rotate60": 0.0,
-    "flash": 0.0,
-    "slowmo": 0.0,
-    "lane_wobble": 0.0,
-    "ghost": 0.0,
-    "spawn_rush": 0.0,
-    "blackout": 0.0,
-    "invert": 0.0
-}
-slowmo_current = 1.0
-slowmo_target = 1.0
+# Effect expiry timestamps: an effect is active while its end time is in
+# the future, so there is no per-frame countdown sweep at all. Storage is a
+# fixed list indexed by Eff — integer offsets, no string hashing on the
+# per-frame paths. Gimmick names stay strings in the UI-facing tables.
+class Eff(IntEnum):
+    SHAKE_SMALL = 0
+    SHAKE_BIG = 1
+    ROTATE60 = 2
+    FLASH = 3
+    SLOWMO = 4
+    LANE_WOBBLE = 5
+    GHOST = 6
+    SPAWN_RUSH = 7
+    BLACKOUT = 8
+    INVERT = 9
+
+effects_end = [0.0] * len(Eff)
+_EFF_BY_NAME = {e.name.lower(): e for e in Eff}
+
+# Most frames have no gimmick running at all; the latest expiry is tracked
+# so those frames answer "anything active?" with one compare instead of
+# probing every possible effect individually.
+effects_until = 0.0
+
+def effect_active(eff, t_now):
+    return effects_end[eff] > t_now
+
+def effect_remaining(eff, t_now):
+    return effects_end[eff] - t_now
+
+def any_effect_active(t_now):
+    return effects_until > t_now
 
 # Scenes
 SCENE_START = "start"
@@ -163,33 +246,95 @@ SCENE_SETTINGS = "settings"
 SCENE_GAME = "game"
 SCENE_GAMEOVER = "gameover"
 SCENE_CLEAR = "clear"
-scene = SCENE_START
-
-# Timing
-start_time_s = None
-next_beat_time = None
-spawn_index = 0
-spawned_target_times = set()
-note_spawn_counter = 0  # counts spawned notes (for yakubi)
-
-# Game state
-notes = []
-combo = 0
-misses = 0
-hannya_visible = False
-hannya_hidden_behind = False
+
+# Posted once per run by the timer armed in reset_and_start_game, exactly
+# when the song (plus prep delay) ends; only SCENE_GAME listens for it.
+EV_BGM_END = pygame.USEREVENT + 1
+
+# Each scene declares which event types it consumes; the transition hook
+# installs that set at SDL level so everything else (MOUSEMOTION, window
+# events, joystick noise) is dropped before it ever reaches the Python queue.
+SCENE_ALLOWED_EVENTS = {
+    SCENE_START:    (pygame.QUIT, pygame.KEYDOWN, pygame.MOUSEBUTTONDOWN),
+    SCENE_SETTINGS: (pygame.QUIT, pygame.KEYDOWN, pygame.MOUSEBUTTONDOWN),
+    SCENE_GAME:     (pygame.QUIT, pygame.KEYDOWN, pygame.MOUSEBUTTONDOWN, EV_BGM_END),
+    SCENE_GAMEOVER: (pygame.QUIT, pygame.KEYDOWN, pygame.MOUSEBUTTONDOWN),
+    SCENE_CLEAR:    (pygame.QUIT, pygame.KEYDOWN, pygame.MOUSEBUTTONDOWN),
+}
+
+class GameState:
+    """Per-run mutable state, bundled behind __slots__ so the hot path does
+    C-level slot loads instead of module-dict probes for every access."""
+    __slots__ = (
+        "running", "scene", "notes", "combo", "misses", "game_over_pending",
+        "hannya_visible", "hannya_hidden_behind",
+        "judge_text", "judge_time_end",
+        # timing (0.0 sentinels mean "not started"; the game clock starts
+        # above zero, so truthiness tests stay valid)
+        "start_time_s", "prep_end_time", "next_beat_time",
+        "spawn_index", "note_spawn_counter",
+        "slowmo_current", "slowmo_target",
+        "dummy_spawn_deadline", "new_gimmick_end",
+        "triggered_gimmicks", "show_gimmicks_panel",
+    )
+
+    def __init__(self):
+        self.running = True
+        self.scene = SCENE_START
+        self.notes = []
+        self.combo = 0
+        self.misses = 0
+        self.game_over_pending = False  # raised at the miss sites when the limit is hit
+        self.hannya_visible = False
+        self.hannya_hidden_behind = False
+        self.judge_text = ""
+        self.judge_time_end = 0.0
+        self.start_time_s = 0.0
+        self.prep_end_time = 0.0
+        self.next_beat_time = 0.0
+        self.spawn_index = 0
+        self.note_spawn_counter = 0  # counts spawned notes (for yakubi)
+        self.slowmo_current = 1.0
+        self.slowmo_target = 1.0
+        self.dummy_spawn_deadline = 0.0
+        self.new_gimmick_end = 0.0
+        self.triggered_gimmicks = []
+        self.show_gimmicks_panel = False
+
+state = GameState()
+
+def enter_scene(new_scene):
+    """FSM transition hook: switch scene and re-arm the SDL event filter."""
+    state.scene = new_scene
+    pygame.event.set_blocked(None)
+    pygame.event.set_allowed(list(SCENE_ALLOWED_EVENTS[new_scene]))
+
+enter_scene(SCENE_START)
+
 hannya_scale_base = 0.45
 
-# Judgement display
-judge_text = ""
-judge_time_end = 0.0
+# Hannya grows with the miss count, which is a small integer per difficulty —
+# pre-scale one surface per possible count instead of rotozooming every frame.
+def _build_hannya_scaled():
+    w, h = HANNYA_IMG.get_size()
+    table = {}
+    for diff, limit in MISS_LIMIT_MAP.items():
+        maxp = max(1, limit - 1)
+        surfs = []
+        for m in range(limit + 1):
+            prog = min(m / float(maxp), 1.0)
+            s = hannya_scale_base + prog * 0.9
+            surfs.append(pygame.transform.smoothscale(HANNYA_IMG, (int(w*s), int(h*s))).convert_alpha())
+        table[diff] = surfs
+    return table
+
+HANNYA_SCALED = _build_hannya_scaled()
 
 # Settings
 offset_seconds = 0.0
 yakubi_mode = False   # 厄日モード checkbox
 
 # Gimmicks tracking
-triggered_gimmicks = []
 GIMMICK_DESCRIPTIONS = {
     "shake_small": "軽い画面の揺れ（短時間）",
     "shake_big": "大きな画面の揺れ（長時間）",
@@ -203,8 +348,10 @@ GIMMICK_DESCRIPTIONS = {
     "invert": "疑似的な色調反転で不穏にする"
 }
 
-# New gimmick notification
-new_gimmick_timer = 0.0
+# The dummy-note spawn gap under spawn_rush is drawn from an exponential
+# distribution: same expected rate as a per-frame Bernoulli roll with one
+# RNG call per spawn instead of one per frame.
+_DUMMY_SPAWN_RATE = 0.03 * FPS  # expected dummy spawns per second
 NEW_GIMMICK_DISPLAY_TIME = 4.0
 
 # Outlined colours for judgement
@@ -216,18 +363,62 @@ START_PREP_DELAY = 1.6
 # Gimmick thresholds
 GIMMICK_COMBO_THRESHOLD = 20  # 20 combos by default
 
+# ----------------- UI layout (static button hit-boxes) -----------------
+# Built once; shared by the renderers and the event handlers.
+START_SRECT = pygame.Rect(WIDTH//2 - 160, HEIGHT//2 - 40, 140, 64)      # Start left of center
+START_CRECT = pygame.Rect(WIDTH//2 - 70, HEIGHT//2 - 40, 140, 64)       # Settings centered
+START_GIMM_RECT = pygame.Rect(WIDTH//2 + 20 + 80, HEIGHT//2 - 40, 140, 64)  # Gimmicks right
+SETTINGS_DONE_RECT = pygame.Rect(WIDTH//2 - 70, HEIGHT//2 + 140, 140, 48)
+SETTINGS_CHECKBOX_RECT = pygame.Rect(WIDTH//2 - 140, 320, 20, 20)
+_EB_X, _EB_Y, _EB_W, _EB_H, _EB_GAP = WIDTH//2 - 300, HEIGHT//2 + 40, 160, 56, 40
+GAMEOVER_R1 = pygame.Rect(_EB_X, _EB_Y, _EB_W, _EB_H)
+GAMEOVER_R2 = pygame.Rect(_EB_X + (_EB_W + _EB_GAP), _EB_Y, _EB_W, _EB_H)
+GAMEOVER_R3 = pygame.Rect(_EB_X + 2*(_EB_W + _EB_GAP), _EB_Y, _EB_W, _EB_H)
+MOK_RECT = MOKUGYO_IMG.get_rect(center=(LANE_X - 30, MOKUGYO_CENTER[1]))
+
 # ----------------- Drawing helpers -----------------
-def draw_outlined_text(text, font, inner_color, outline_color, pos, outline_width=2):
+# Full-screen tint overlays (flash/blackout/invert): one opaque surface per
+# color, allocated and filled once. Per frame we only set_alpha and blit,
+# instead of allocating and filling a fresh 1280x720 SRCALPHA surface.
+def _make_overlay(color):
+    s = pygame.Surface((WIDTH, HEIGHT))
+    s.fill(color)
+    return s.convert()
+
+OVERLAY_FLASH = _make_overlay((255,60,60))
+OVERLAY_BLACKOUT = _make_overlay((0,0,0))
+OVERLAY_INVERT = _make_overlay((180,180,255))
+
+# Outlined labels are re-drawn every frame (HUD, combo, judgement, countdown)
+# but the actual strings change rarely, so keep the baked surfaces around.
+_OUTLINE_CACHE = {}
+_OUTLINE_CACHE_MAX = 256
+
+def _build_outlined_surface(text, font, inner_color, outline_color, outline_width):
+    # Two renders total: the inner text and an outline-colored silhouette.
+    # Dilating the silhouette along each axis with BLEND_RGBA_MAX gives the
+    # same outline as rendering the string once per (dx,dy) offset.
+    ow = outline_width
     txt = font.render(text, True, inner_color)
+    sil = font.render(text, True, outline_color)
     w,h = txt.get_size()
-    surf = pygame.Surface((w + outline_width*2, h + outline_width*2), pygame.SRCALPHA)
-    for dx in range(-outline_width, outline_width+1):
-        for dy in range(-outline_width, outline_width+1):
-            if dx == 0 and dy == 0: continue
-            surf.blit(font.render(text, True, outline_color), (dx+outline_width, dy+outline_width))
-    surf.blit(txt, (outline_width, outline_width))
+    surf = pygame.Surface((w + ow*2, h + ow*2), pygame.SRCALPHA)
+    for d in range(-ow, ow+1):
+        surf.blit(sil, (d+ow, ow), special_flags=pygame.BLEND_RGBA_MAX)
+        surf.blit(sil, (ow, d+ow), special_flags=pygame.BLEND_RGBA_MAX)
+    surf.blit(txt, (ow, ow))
+    return surf.convert_alpha()
+
+def draw_outlined_text(text, font, inner_color, outline_color, pos, outline_width=2, dest=None):
+    key = (text, id(font), inner_color, outline_color, outline_width)
+    surf = _OUTLINE_CACHE.get(key)
+    if surf is None:
+        surf = _build_outlined_surface(text, font, inner_color, outline_color, outline_width)
+        if len(_OUTLINE_CACHE) >= _OUTLINE_CACHE_MAX:
+            _OUTLINE_CACHE.pop(next(iter(_OUTLINE_CACHE)))
+        _OUTLINE_CACHE[key] = surf
     rect = surf.get_rect(center=pos)
-    screen.blit(surf, rect)
+    (dest if dest is not None else screen).blit(surf, rect)
 
 def draw_bold_on_white(text, font, text_color, pos, padding=(8,4)):
     txt = font.render(text, True, text_color)
@@ -242,33 +433,48 @@ def draw_bold_on_white(text, font, text_color, pos, padding=(8,4)):
     return rect  # so caller can know area (not needed but available)
 
 # ----------------- Audio functions -----------------
-def play_bgm_once():
-    global start_time_s, next_beat_time, spawn_index, prep_end_time
+# Mixer start/stop can block for tens of ms on some platforms, which reads
+# as a hitch frame right at a scene transition. A single worker keeps those
+# calls off the main thread while still serializing stop/play pairs.
+_audio_pool = ThreadPoolExecutor(max_workers=1)
+
+def _bgm_start():
+    try:
+        BGM.stop(); BGM.set_volume(0.95); BGM.play()
+    except Exception:
+        pass
+
+def _bgm_stop():
+    try:
+        BGM.stop()
+    except Exception:
+        pass
+
+def _bgm_soft_loop():
+    try:
+        BGM.stop(); BGM.set_volume(0.18); BGM.play(loops=-1)
+    except Exception:
+        pass
+
+def play_bgm_once(t_now):
     if BGM:
-        try:
-            BGM.stop(); BGM.set_volume(0.95); BGM.play()
-        except Exception:
-            pass
-    # We'll start beat timing after PREP_DELAY to give player prep time
-    start_time_s = now_s()
-    prep_end_time = start_time_s + START_PREP_DELAY
-    next_beat_time = prep_end_time + offset_seconds
-    spawn_index = 0
-    spawned_target_times.clear()
-    global note_spawn_counter
-    note_spawn_counter = 0
+        _audio_pool.submit(_bgm_start)
+    # Beat timing stays on the main thread and is anchored to t_now, not to
+    # when the mixer actually starts; we'll begin after PREP_DELAY to give
+    # the player prep time
+    state.start_time_s = t_now
+    state.prep_end_time = state.start_time_s + START_PREP_DELAY
+    state.next_beat_time = state.prep_end_time + offset_seconds
+    state.spawn_index = 0
+    state.note_spawn_counter = 0
 
 def stop_bgm():
     if BGM:
-        try: BGM.stop()
-        except: pass
+        _audio_pool.submit(_bgm_stop)
 
 def play_bgm_soft_loop():
     if BGM:
-        try:
-            BGM.stop(); BGM.set_volume(0.18); BGM.play(loops=-1)
-        except Exception:
-            pass
+        _audio_pool.submit(_bgm_soft_loop)
 
 def play_se(s):
     if s:
@@ -278,143 +484,206 @@ def play_se(s):
 
 # ----------------- Note class -----------------
 class Note:
+    # the travel segment (NOTE_START_Y -> HITLINE_Y) is shared by every note,
+    # so instances carry only the per-note varying fields
+    __slots__ = ("target_time","spawn_time","x","y","hit","dead","dummy")
+
     def __init__(self, target_time, x, dummy=False):
+        self.dummy = dummy
+        self.reset(target_time, x)
+
+    def reset(self, target_time, x):
+        # re-arm in place so pooled notes are reused without reallocation
         self.target_time = target_time
         self.spawn_time = target_time - NOTE_TRAVEL_SEC
         self.x = x
-        self.start_y = -60
-        self.hit_y = HITLINE_Y
-        self.y = self.start_y
+        self.y = NOTE_START_Y
         self.hit = False
         self.dead = False
-        self.dummy = dummy
 
-    def update(self, t_now):
-        total = max(0.001, NOTE_TRAVEL_SEC)
-        p = (t_now - self.spawn_time) / total
-        p = clamp(p, 0.0, 1.0)
-        # linear motion for constant speed
-        self.y = self.start_y + (self.hit_y - self.start_y) * p
-        # disappear immediately after judgement window to keep view clear
-        grace = OK_WINDOW * DIFF_WINDOW[DIFFICULTY] + 0.01
-        if t_now - self.target_time > grace:
-            self.dead = True
-
-    def draw(self, ox=0, oy=0, ghost=False, lane_wobble_amt=0.0, play_area_offset=(0,0)):
-        wob = 0
-        if lane_wobble_amt != 0.0:
-            phase = (self.spawn_time + self.y) * 0.085
-            wob = math.sin(phase + time.time()*2.5) * lane_wobble_amt
-        if self.dummy:
-            col = (150,150,150) if not ghost else (130,130,130)
-        else:
-            col = (220,220,220) if ghost else (255,255,255)
+    def draw(self, ox=0, oy=0, ghost=False, wob=0.0, play_area_offset=(0,0)):
         x = int(self.x + wob + ox + play_area_offset[0])
         y = int(self.y + oy + play_area_offset[1])
-        pygame.draw.circle(screen, col, (x, y), NOTE_RADIUS)
+        screen.blit(NOTE_SURFS[(ghost, self.dummy)], (x - NOTE_RADIUS - 1, y - NOTE_RADIUS - 1))
+
+# Dummy notes churn quickly under spawn_rush; recycle them through a small
+# pool so the effect doesn't allocate a fresh Note per spawn.
+_dummy_pool = [Note(0.0, LANE_X, dummy=True) for _ in range(16)]
+
+def spawn_dummy_note(target_time):
+    n = _dummy_pool.pop() if _dummy_pool else Note(0.0, LANE_X, dummy=True)
+    n.reset(target_time, LANE_X)
+    bisect.insort(state.notes, n, key=_note_key)
+
+def update_notes(t_now):
+    # The update kernel lives here rather than as a Note method: one batch
+    # pass with the shared values hoisted to locals, no per-note method
+    # dispatch. (This project carries no compiled-extension dependency, so
+    # this plain loop is the stand-in for lowering the kernel further.)
+    grace_cut = t_now - (_W_OK + 0.01)  # alive notes with target_time older than this die
+    inv = _INV_NOTE_TRAVEL_SEC
+    y0 = NOTE_START_Y
+    span = NOTE_SPAN_Y
+    for n in state.notes:
+        # notes only spawn once t_now >= spawn_time, so progress can't go
+        # negative; only the hitline overshoot needs capping
+        p = (t_now - n.spawn_time) * inv
+        if p > 1.0:
+            p = 1.0
+        # linear motion for constant speed
+        n.y = y0 + span * p
+        # disappear immediately after judgement window to keep view clear
+        if n.target_time < grace_cut:
+            n.dead = True
 
 # ----------------- Scheduling notes (beat-synced) -----------------
 def schedule_notes_up_to(t_now):
-    global spawn_index, next_beat_time, note_spawn_counter
-    if next_beat_time is None:
+    if not state.next_beat_time:
         return
-    while True:
-        beat_time = next_beat_time + spawn_index * SPB
-        spawn_time = beat_time - NOTE_TRAVEL_SEC
-        if spawn_time <= t_now:
-            if beat_time not in spawned_target_times:
-                notes.append(Note(target_time=beat_time, x=LANE_X, dummy=False))
-                spawned_target_times.add(beat_time)
-                note_spawn_counter += 1
-                # If yakubi mode: trigger gimmick every 10 notes spawned
-                if yakubi_mode and (note_spawn_counter % 10 == 0):
-                    trigger_random_gimmick_by_name(note_spawn_counter)
-            spawn_index += 1
-        else:
-            break
+    # incremental beat stepping: no multiply or window re-derivation per beat
+    # spawn_index is strictly increasing and beats are generated in order,
+    # so each beat is spawned exactly once — no seen-set needed.
+    beat_time = state.next_beat_time + state.spawn_index * SPB
+    horizon = t_now + NOTE_TRAVEL_SEC
+    if beat_time > horizon:
+        return
+    # count the due beats in closed form, then emit them as one batch; after
+    # a long frame or resume the catch-up is a single range loop with no
+    # per-beat horizon test
+    n_due = int((horizon - beat_time) / SPB) + 1
+    append = state.notes.append
+    for _ in range(n_due):
+        append(Note(target_time=beat_time, x=LANE_X, dummy=False))
+        state.note_spawn_counter += 1
+        # If yakubi mode: trigger gimmick every 10 notes spawned
+        if yakubi_mode and (state.note_spawn_counter % 10 == 0):
+            trigger_random_gimmick_by_name(state.note_spawn_counter)
+        beat_time += SPB
+    state.spawn_index += n_due
 
 # ----------------- Judgement -----------------
-def compute_judgement(dt):
+# Difficulty-scaled windows and limits, refreshed when DIFFICULTY changes
+# so the per-click judgement is three bare float compares and the per-miss
+# checks are plain scalar loads.
+_W_PERFECT = _W_GOOD = _W_OK = 0.0
+_miss_limit = 0
+
+def refresh_judgement_windows():
+    global _W_PERFECT, _W_GOOD, _W_OK, _INTENSITY_PER_MISS, _miss_limit
     w = DIFF_WINDOW[DIFFICULTY]
-    if dt <= PERFECT_WINDOW * w: return "PERFECT"
-    if dt <= GOOD_WINDOW * w: return "GOOD"
-    if dt <= OK_WINDOW * w: return "OK"
+    _W_PERFECT = PERFECT_WINDOW * w
+    _W_GOOD = GOOD_WINDOW * w
+    _W_OK = OK_WINDOW * w
+    _miss_limit = MISS_LIMIT_MAP[DIFFICULTY]
+    _INTENSITY_PER_MISS = 1.5 / max(1, _miss_limit)
+
+refresh_judgement_windows()
+
+def compute_judgement(dt):
+    if dt <= _W_PERFECT: return "PERFECT"
+    if dt <= _W_GOOD: return "GOOD"
+    if dt <= _W_OK: return "OK"
     return "MISS"
 
-def hit_check():
-    global combo, misses, judge_text, judge_time_end, hannya_visible, hannya_hidden_behind, new_gimmick_timer
-    tnow = now_s()
+def _note_key(n):
+    return n.target_time
+
+def hit_check(t_hit):
+    # t_hit is the timestamp captured at the top of the frame, before any
+    # simulation work, so judgement isn't skewed by within-frame processing
+    tnow = t_hit
+    # notes is kept sorted by target_time (dummies are insorted), so the
+    # nearest-in-time note is a neighbour of the bisect point; scan outward
+    # past dead/hit/dummy entries instead of walking the whole list.
+    notes = state.notes  # local bind: the scan below touches it repeatedly
     best = None; best_dt = 1e9
-    for n in notes:
-        if n.dead or n.hit or n.dummy: continue
-        dt = abs(n.target_time - tnow)
-        if dt < best_dt:
-            best_dt = dt; best = n
+    i = bisect.bisect_left(notes, tnow, key=_note_key)
+    j = i - 1
+    while j >= 0:
+        n = notes[j]
+        if not (n.dead or n.hit or n.dummy):
+            best = n; best_dt = abs(n.target_time - tnow)
+            break
+        j -= 1
+    j = i
+    while j < len(notes):
+        n = notes[j]
+        if not (n.dead or n.hit or n.dummy):
+            dt = abs(n.target_time - tnow)
+            if dt < best_dt:
+                best = n; best_dt = dt
+            break
+        j += 1
     if best:
         judg = compute_judgement(best_dt)
         if judg != "MISS":
-            try: notes.remove(best)
-            except: pass
-            combo += 1
+            best.hit = True
+            while notes and (notes[0].hit or notes[0].dead):
+                notes.pop(0)
+            state.combo += 1
             # If not yakubi mode, trigger by combo threshold
-            if not yakubi_mode and (combo % GIMMICK_COMBO_THRESHOLD == 0):
-                trigger_random_gimmick_by_name(combo)
+            if not yakubi_mode and (state.combo % GIMMICK_COMBO_THRESHOLD == 0):
+                trigger_random_gimmick_by_name(state.combo)
             play_se(SE_HIT)
         else:
-            combo = 0
-            misses += 1
+            state.combo = 0
+            state.misses += 1
             play_se(SE_MISS)
-            if not hannya_visible: hannya_visible = True
-            if misses >= HIDE_STEP and misses < MISS_LIMIT_MAP[DIFFICULTY]:
-                hannya_hidden_behind = True
-        judge_text = judg
-        judge_time_end = tnow + 0.7
+            if not state.hannya_visible: state.hannya_visible = True
+            if state.misses >= HIDE_STEP and state.misses < _miss_limit:
+                state.hannya_hidden_behind = True
+            if state.misses >= _miss_limit:
+                state.game_over_pending = True
+        state.judge_text = judg
+        state.judge_time_end = tnow + 0.7
     else:
-        combo = 0
-        misses += 1
+        state.combo = 0
+        state.misses += 1
         play_se(SE_MISS)
-        judge_text = "MISS"
-        judge_time_end = now_s() + 0.7
-        if not hannya_visible: hannya_visible = True
-        if misses >= HIDE_STEP and misses < MISS_LIMIT_MAP[DIFFICULTY]:
-            hannya_hidden_behind = True
+        state.judge_text = "MISS"
+        state.judge_time_end = tnow + 0.7
+        if not state.hannya_visible: state.hannya_visible = True
+        if state.misses >= HIDE_STEP and state.misses < _miss_limit:
+            state.hannya_hidden_behind = True
+        if state.misses >= _miss_limit:
+            state.game_over_pending = True
 
 # ----------------- Gimmicks -----------------
 def record_gimmick(name):
-    global new_gimmick_timer
-    if name not in triggered_gimmicks:
-        triggered_gimmicks.append(name)
-        new_gimmick_timer = NEW_GIMMICK_DISPLAY_TIME
+    if name not in state.triggered_gimmicks:
+        state.triggered_gimmicks.append(name)
+        state.new_gimmick_end = now_s() + NEW_GIMMICK_DISPLAY_TIME
+
+# base effect duration per gimmick, scaled by the miss intensity on trigger
+GIMMICK_DURATIONS = {
+    "shake_small": 1.6,
+    "shake_big": 2.8,
+    "rotate60": 3.6,
+    "flash": 0.6,
+    "slowmo": 5.0,
+    "lane_wobble": 4.0,
+    "ghost": 4.0,
+    "spawn_rush": 6.0,
+    "blackout": 3.0,
+    "invert": 4.0
+}
+
+# candidate pool for random gimmicks; None means "nothing fires this time"
+_GIMMICK_OPTS = ("shake_small","shake_big","rotate60","flash","slowmo","lane_wobble","ghost","spawn_rush","blackout","invert", None)
 
 def trigger_random_gimmick_by_name(context_val):
     # choose random gimmick, record it, set effect timers
-    opts = ["shake_small","shake_big","rotate60","flash","slowmo","lane_wobble","ghost","spawn_rush","blackout","invert", None]
-    choice = random.choice(opts)
+    choice = _GIMMICK_OPTS[random.randrange(len(_GIMMICK_OPTS))]
     if choice is None:
         return
     record_gimmick(choice)
-    # intensity scales with misses
-    intensity = 1.0 + (misses / max(1, MISS_LIMIT_MAP[DIFFICULTY])) * 1.5
-    if choice == "shake_small":
-        effects["shake_small"] = 1.6 * intensity
-    elif choice == "shake_big":
-        effects["shake_big"] = 2.8 * intensity
-    elif choice == "rotate60":
-        effects["rotate60"] = 3.6 * intensity
-    elif choice == "flash":
-        effects["flash"] = 0.6 * intensity
-    elif choice == "slowmo":
-        effects["slowmo"] = 5.0 * intensity
-    elif choice == "lane_wobble":
-        effects["lane_wobble"] = 4.0 * intensity
-    elif choice == "ghost":
-        effects["ghost"] = 4.0 * intensity
-    elif choice == "spawn_rush":
-        effects["spawn_rush"] = 6.0 * intensity
-    elif choice == "blackout":
-        effects["blackout"] = 3.0 * intensity
-    elif choice == "invert":
-        effects["invert"] = 4.0 * intensity
+    # intensity scales with misses (per-miss step cached per difficulty)
+    intensity = 1.0 + state.misses * _INTENSITY_PER_MISS
+    end = now_s() + GIMMICK_DURATIONS[choice] * intensity
+    effects_end[_EFF_BY_NAME[choice]] = end
+    global effects_until
+    if end > effects_until:
+        effects_until = end
 
 # ----------------- Neck snap (final kill) -----------------
 def neck_snap_and_gameover():
@@ -430,148 +699,177 @@ def neck_snap_and_gameover():
     pygame.time.delay(220)
 
 # ----------------- Auto-miss when timed out -----------------
-def register_auto_miss():
-    global combo, misses, judge_text, judge_time_end, hannya_visible, hannya_hidden_behind
-    combo = 0
-    misses += 1
+def register_auto_miss(t_now):
+    state.combo = 0
+    state.misses += 1
     play_se(SE_MISS)
-    judge_text = "MISS"
-    judge_time_end = now_s() + 0.7
-    if not hannya_visible: hannya_visible = True
-    if misses >= HIDE_STEP and misses < MISS_LIMIT_MAP[DIFFICULTY]:
-        hannya_hidden_behind = True
+    state.judge_text = "MISS"
+    state.judge_time_end = t_now + 0.7
+    if not state.hannya_visible: state.hannya_visible = True
+    if state.misses >= HIDE_STEP and state.misses < _miss_limit:
+        state.hannya_hidden_behind = True
+    if state.misses >= _miss_limit:
+        state.game_over_pending = True
 
 # ----------------- Rendering -----------------
 def draw_frame_bg():
     screen.fill((0,0,0))
     screen.blit(BG_IMG, (0,0))
 
-def render_start(show_gimmicks_panel=False):
-    draw_frame_bg()
-    # Buttons: Start (left), Settings (center), Gimmicks (right) — ensure Settings is centered
-    srect = pygame.Rect(WIDTH//2 - 160, HEIGHT//2 - 40, 140, 64)  # Start left of center
-    crect = pygame.Rect(WIDTH//2 - 70, HEIGHT//2 - 40, 140, 64)   # Settings centered
-    gimm_rect = pygame.Rect(WIDTH//2 + 20 + 80, HEIGHT//2 - 40, 140, 64)  # Gimmicks right
-    pygame.draw.rect(screen, (255,255,255), srect, border_radius=8)
-    draw_outlined_text("Start", FONT_MD, (0,0,0), (255,255,255), srect.center, outline_width=2)
-    pygame.draw.rect(screen, (200,200,200), crect, border_radius=8)
-    draw_outlined_text("Settings", FONT_MD, (0,0,0), (200,200,200), crect.center, outline_width=2)
-    pygame.draw.rect(screen, (220,220,220), gimm_rect, border_radius=8)
-    draw_outlined_text("異変", FONT_MD, (0,0,0), (220,220,220), gimm_rect.center, outline_width=2)
-
-    if show_gimmicks_panel:
-        w,h = 520, 320
-        px,py = WIDTH//2 - w//2, HEIGHT//2 + 60
-        panel = pygame.Surface((w,h), pygame.SRCALPHA)
-        panel.fill((8,8,8,220))
-        screen.blit(panel, (px,py))
-        draw_outlined_text("発現した異変一覧", FONT_MD, (255,255,255), (0,0,0), (px + w//2, py + 30), outline_width=1)
-        if not triggered_gimmicks:
-            draw_outlined_text("まだ異変は発現していません", FONT_SM, (200,200,200), (0,0,0), (px + w//2, py + 80), outline_width=1)
-        else:
-            yy = py + 70
-            for name in triggered_gimmicks:
-                desc = GIMMICK_DESCRIPTIONS.get(name, "説明なし")
-                draw_outlined_text(f"- {name}: {desc}", FONT_SM, (220,220,220), (0,0,0), (px + 20 + 300, yy), outline_width=1)
-                yy += 34
+# Menu screens are static between input events, so bake each one into a
+# single surface and blit it per frame; only dynamic overlays (the gimmicks
+# panel) are drawn on top. The settings bake is keyed by the settings values
+# and rebuilt when they change.
+_START_SURF = None
+_GAMEOVER_SURF = None
+_CLEAR_SURF = None
+_SETTINGS_SURF_KEY = None
+_SETTINGS_SURF = None
+_GIMM_PANEL_SURF = None
+_GIMM_PANEL_KEY = None
+
+def _build_start_surface():
+    surf = pygame.Surface((WIDTH, HEIGHT))
+    surf.blit(BG_IMG, (0,0))
+    # Buttons: Start (left), Settings (center), Gimmicks (right)
+    pygame.draw.rect(surf, (255,255,255), START_SRECT, border_radius=8)
+    draw_outlined_text("Start", FONT_MD, (0,0,0), (255,255,255), START_SRECT.center, outline_width=2, dest=surf)
+    pygame.draw.rect(surf, (200,200,200), START_CRECT, border_radius=8)
+    draw_outlined_text("Settings", FONT_MD, (0,0,0), (200,200,200), START_CRECT.center, outline_width=2, dest=surf)
+    pygame.draw.rect(surf, (220,220,220), START_GIMM_RECT, border_radius=8)
+    draw_outlined_text("異変", FONT_MD, (0,0,0), (220,220,220), START_GIMM_RECT.center, outline_width=2, dest=surf)
+    return surf.convert()
+
+def _build_gimmicks_panel():
+    w,h = 520, 320
+    panel = pygame.Surface((w,h), pygame.SRCALPHA)
+    panel.fill((8,8,8,220))
+    draw_outlined_text("発現した異変一覧", FONT_MD, (255,255,255), (0,0,0), (w//2, 30), outline_width=1, dest=panel)
+    if not state.triggered_gimmicks:
+        draw_outlined_text("まだ異変は発現していません", FONT_SM, (200,200,200), (0,0,0), (w//2, 80), outline_width=1, dest=panel)
+    else:
+        yy = 70
+        for name in state.triggered_gimmicks:
+            desc = GIMMICK_DESCRIPTIONS.get(name, "説明なし")
+            draw_outlined_text(f"- {name}: {desc}", FONT_SM, (220,220,220), (0,0,0), (20 + 300, yy), outline_width=1, dest=panel)
+            yy += 34
+    return panel.convert_alpha()
+
+def render_start(show_panel=False):
+    global _START_SURF, _GIMM_PANEL_SURF, _GIMM_PANEL_KEY
+    if _START_SURF is None:
+        _START_SURF = _build_start_surface()
+    screen.blit(_START_SURF, (0,0))
+
+    if show_panel:
+        # triggered_gimmicks is append-only, so the length keys the bake
+        if _GIMM_PANEL_SURF is None or _GIMM_PANEL_KEY != len(state.triggered_gimmicks):
+            _GIMM_PANEL_SURF = _build_gimmicks_panel()
+            _GIMM_PANEL_KEY = len(state.triggered_gimmicks)
+        screen.blit(_GIMM_PANEL_SURF, (WIDTH//2 - 260, HEIGHT//2 + 60))
 
     pygame.display.flip()
 
-def render_settings():
-    screen.fill((0,0,0))
-    draw_outlined_text("Settings", FONT_LG, (255,255,255), (0,0,0), (WIDTH//2, 100), outline_width=2)
-    draw_outlined_text(f"Difficulty: {DIFFICULTY}  (←/→)", FONT_MD, (220,220,220), (0,0,0), (WIDTH//2, 170), outline_width=1)
-    draw_outlined_text(f"Judge pos: {'上' if DIFFICULTY_JUDGEPOS=='top' else '下'}  (↑/↓)", FONT_MD, (220,220,220), (0,0,0), (WIDTH//2, 220), outline_width=1)
-    draw_outlined_text(f"Offset: {offset_seconds:+.3f}s  ([ / ] で調整)", FONT_MD, (200,200,200), (0,0,0), (WIDTH//2, 270), outline_width=1)
+def _build_settings_surface():
+    surf = pygame.Surface((WIDTH, HEIGHT))
+    surf.fill((0,0,0))
+    draw_outlined_text("Settings", FONT_LG, (255,255,255), (0,0,0), (WIDTH//2, 100), outline_width=2, dest=surf)
+    draw_outlined_text(f"Difficulty: {DIFFICULTY}  (←/→)", FONT_MD, (220,220,220), (0,0,0), (WIDTH//2, 170), outline_width=1, dest=surf)
+    draw_outlined_text(f"Judge pos: {'上' if DIFFICULTY_JUDGEPOS=='top' else '下'}  (↑/↓)", FONT_MD, (220,220,220), (0,0,0), (WIDTH//2, 220), outline_width=1, dest=surf)
+    draw_outlined_text(f"Offset: {offset_seconds:+.3f}s  ([ / ] で調整)", FONT_MD, (200,200,200), (0,0,0), (WIDTH//2, 270), outline_width=1, dest=surf)
     # Yakubi mode checkbox
-    checkbox_rect = pygame.Rect(WIDTH//2 - 140, 320, 20, 20)
-    pygame.draw.rect(screen, (255,255,255), checkbox_rect, border_radius=3)
+    pygame.draw.rect(surf, (255,255,255), SETTINGS_CHECKBOX_RECT, border_radius=3)
     if yakubi_mode:
-        pygame.draw.line(screen, (200,20,20), (checkbox_rect.left+4, checkbox_rect.top+10), (checkbox_rect.right-4, checkbox_rect.top+10), 3)
-    draw_outlined_text("厄日モード (Yakubi): 異変が10ノーツごとに発生", FONT_SM, (220,220,220), (0,0,0), (WIDTH//2 + 60, 330), outline_width=1)
+        pygame.draw.line(surf, (200,20,20), (SETTINGS_CHECKBOX_RECT.left+4, SETTINGS_CHECKBOX_RECT.top+10), (SETTINGS_CHECKBOX_RECT.right-4, SETTINGS_CHECKBOX_RECT.top+10), 3)
+    draw_outlined_text("厄日モード (Yakubi): 異変が10ノーツごとに発生", FONT_SM, (220,220,220), (0,0,0), (WIDTH//2 + 60, 330), outline_width=1, dest=surf)
 
     # Done button
-    done_rect = pygame.Rect(WIDTH//2 - 70, HEIGHT//2 + 140, 140, 48)
-    pygame.draw.rect(screen, (200,200,200), done_rect, border_radius=8)
-    draw_outlined_text("完了", FONT_MD, (0,0,0), (200,200,200), done_rect.center, outline_width=1)
-    pygame.display.flip()
-
-def render_game(prep_countdown=None, play_area_offset=(0,0), show_new_notice_rect=None):
-    global slowmo_current, slowmo_target
-    draw_frame_bg()
-    tnow = now_s()
-
-    # schedule notes (only after prep_end_time)
-    if next_beat_time is not None:
-        schedule_notes_up_to(tnow)
+    pygame.draw.rect(surf, (200,200,200), SETTINGS_DONE_RECT, border_radius=8)
+    draw_outlined_text("完了", FONT_MD, (0,0,0), (200,200,200), SETTINGS_DONE_RECT.center, outline_width=1, dest=surf)
+    return surf.convert()
 
-    # update slowmo visual (does not change timing)
-    if effects["slowmo"] > 0:
-        slowmo_target = 0.55
-    else:
-        slowmo_target = 1.0
-    ramp_speed = 0.6
-    slowmo_current += (slowmo_target - slowmo_current) * min(1.0, ramp_speed * (1.0/FPS))
+def render_settings():
+    global _SETTINGS_SURF, _SETTINGS_SURF_KEY
+    key = (DIFFICULTY, DIFFICULTY_JUDGEPOS, yakubi_mode, offset_seconds)
+    if _SETTINGS_SURF is None or _SETTINGS_SURF_KEY != key:
+        _SETTINGS_SURF = _build_settings_surface()
+        _SETTINGS_SURF_KEY = key
+    screen.blit(_SETTINGS_SURF, (0,0))
+    pygame.display.flip()
 
-    # update notes and remove timed-out ones immediately
-    for n in list(notes):
-        n.update(tnow)
-        if n.dead:
-            try: notes.remove(n)
-            except: pass
-            register_auto_miss()
+def render_game(frame_now):
+    # draw-only: all simulation (scheduling, note updates, dummy spawns)
+    # happens in the main loop's update phase before this is called
+    tnow = frame_now
+    fx = any_effect_active(tnow)  # one compare gates all the effect probes
+
+    # dead-render culling: while the blackout overlay is near-opaque nothing
+    # underneath is visible, so skip the whole world draw (the state updates
+    # above still ran) and present only the black screen plus the notification
+    blackout_rem = effect_remaining(Eff.BLACKOUT, tnow) if fx else 0.0
+    blackout_alpha = int(220 * min(1.0, blackout_rem)) if blackout_rem > 0 else 0
+    if blackout_alpha >= 210:
+        screen.fill((0,0,0))
+        if tnow < state.new_gimmick_end:
+            draw_bold_on_white("新しい異変が発現しました。", FONT_BOLD, (200,30,30), (WIDTH - 12, HEIGHT - 12))
+        pygame.display.flip()
+        return
 
-    # spawn dummy notes (spawn_rush)
-    if effects["spawn_rush"] > 0 and random.random() < 0.03:
-        notes.append(Note(target_time=tnow + NOTE_TRAVEL_SEC*0.5, x=LANE_X, dummy=True))
+    draw_frame_bg()
 
     # lane wobble amplitude
     lane_wobble_amt = 0.0
-    if effects["lane_wobble"] > 0:
+    if fx and effect_active(Eff.LANE_WOBBLE, tnow):
         base = 30.0
-        intensity = 1.0 + (misses / max(1, MISS_LIMIT_MAP[DIFFICULTY])) * 1.2
+        intensity = 1.0 + (state.misses / max(1, _miss_limit)) * 1.2
         lane_wobble_amt = base * intensity
 
     # play area shake offsets (when shake_small/shake_big or lane_wobble active, the whole PLAY_AREA shakes)
+    # one wall-clock snapshot per frame; every shake/wobble phase derives from it
+    t = time.time()
     play_area_ox = play_area_oy = 0
-    if effects["shake_small"] > 0:
-        play_area_ox = int(math.sin(time.time()*8.0) * 6)
-        play_area_oy = int(math.cos(time.time()*7.0) * 4)
-    if effects["shake_big"] > 0:
-        play_area_ox += int(math.sin(time.time()*10.0) * 14)
-        play_area_oy += int(math.cos(time.time()*8.5) * 10)
-    if effects["lane_wobble"] > 0:
+    if fx and effect_active(Eff.SHAKE_SMALL, tnow):
+        play_area_ox = int(math.sin(t*8.0) * 6)
+        play_area_oy = int(math.cos(t*7.0) * 4)
+    if fx and effect_active(Eff.SHAKE_BIG, tnow):
+        play_area_ox += int(math.sin(t*10.0) * 14)
+        play_area_oy += int(math.cos(t*8.5) * 10)
+    if fx and effect_active(Eff.LANE_WOBBLE, tnow):
         # smaller overall sway added
-        play_area_ox += int(math.sin(time.time()*5.0) * (lane_wobble_amt*0.25))
+        play_area_ox += int(math.sin(t*5.0) * (lane_wobble_amt*0.25))
 
     # camera offsets (small additional)
     cam_ox = cam_oy = 0
 
-    # draw play area border (white) with applied play_area offsets
-    pa_rect = pygame.Rect(PLAY_AREA.left + play_area_ox, PLAY_AREA.top + play_area_oy, PLAY_AREA.width, PLAY_AREA.height)
-    pygame.draw.rect(screen, (255,255,255), pa_rect, width=4)
+    # draw play area border + hitline overlay with applied play_area offsets
+    screen.blit(PLAYFIELD_OVERLAY, (PLAY_AREA.left + play_area_ox, PLAY_AREA.top + play_area_oy))
 
     # HUD (center top)
-    draw_outlined_text(f"COMBO {combo}", FONT_MD, (255,215,0), (0,0,0), (WIDTH//2 + cam_ox, 30 + cam_oy), outline_width=2)
-    draw_outlined_text(f"MISS {misses}/{MISS_LIMIT_MAP[DIFFICULTY]}", FONT_SM, (255,120,120), (0,0,0), (WIDTH//2 + cam_ox, 64 + cam_oy), outline_width=1)
+    draw_outlined_text(f"COMBO {state.combo}", FONT_MD, (255,215,0), (0,0,0), (WIDTH//2 + cam_ox, 30 + cam_oy), outline_width=2)
+    draw_outlined_text(f"MISS {state.misses}/{_miss_limit}", FONT_SM, (255,120,120), (0,0,0), (WIDTH//2 + cam_ox, 64 + cam_oy), outline_width=1)
 
     # left-top mark inside play area (account for play area offset)
     draw_outlined_text("お経開始", FONT_SM, (255,255,255), (0,0,0), (PLAY_AREA.left + 70 + play_area_ox, PLAY_AREA.top + 24 + play_area_oy), outline_width=1)
 
-    # hitline matching play area inner extents
-    hl_left = PLAY_AREA.left + 8 + play_area_ox
-    hl_right = PLAY_AREA.right - 8 + play_area_ox
-    pygame.draw.line(screen, (0,0,0), (hl_left, HITLINE_Y + play_area_oy), (hl_right, HITLINE_Y + play_area_oy), 4)
-
     # judgement text ABOVE the hitline
-    if judge_text and now_s() < judge_time_end:
-        out_c = OUTLINE_COLORS.get(judge_text, (0,0,0))
-        draw_outlined_text(judge_text, FONT_MD, (255,255,255), out_c, (LANE_X + play_area_ox, HITLINE_Y - 48 + play_area_oy), outline_width=2)
-
-    # draw notes; pass play_area_offset for entire-lane wobble
-    ghost_flag = effects["ghost"] > 0
-    for n in notes:
-        n.draw(ox=0, oy=0, ghost=ghost_flag, lane_wobble_amt=lane_wobble_amt, play_area_offset=(play_area_ox, play_area_oy))
+    if state.judge_text and tnow < state.judge_time_end:
+        out_c = OUTLINE_COLORS.get(state.judge_text, (0,0,0))
+        draw_outlined_text(state.judge_text, FONT_MD, (255,255,255), out_c, (LANE_X + play_area_ox, HITLINE_Y - 48 + play_area_oy), outline_width=2)
+
+    # draw notes; wobble for the whole buffer is computed here in one pass
+    # (shared phase base and a locally bound sin) rather than inside each draw
+    ghost_flag = fx and effect_active(Eff.GHOST, tnow)
+    pa_off = (play_area_ox, play_area_oy)
+    if lane_wobble_amt != 0.0:
+        sin = math.sin
+        wt = t * 2.5
+        for n in state.notes:
+            if n.hit: continue
+            n.draw(ghost=ghost_flag, wob=sin((n.spawn_time + n.y) * 0.085 + wt) * lane_wobble_amt, play_area_offset=pa_off)
+    else:
+        for n in state.notes:
+            if n.hit: continue
+            n.draw(ghost=ghost_flag, play_area_offset=pa_off)
 
     # draw mokugyo (small) inside play area
     mok_rect = MOKUGYO_IMG.get_rect()
@@ -579,290 +877,315 @@ def render_game(prep_countdown=None, play_area_offset=(0,0), show_new_notice_rec
     screen.blit(MOKUGYO_IMG, mok_rect)
 
     # draw hannya (on right side)
-    if hannya_visible and not hannya_hidden_behind:
-        maxp = max(1, MISS_LIMIT_MAP[DIFFICULTY] - 1)
-        prog = min(misses / float(maxp), 1.0) if maxp > 0 else 1.0
-        scale = hannya_scale_base + prog * 0.9
-        img = pygame.transform.rotozoom(HANNYA_IMG, 0, scale)
+    if state.hannya_visible and not state.hannya_hidden_behind:
+        img = HANNYA_SCALED[DIFFICULTY][min(state.misses, _miss_limit)]
         rect = img.get_rect(center=(HANNYA_TARGET_X, HANNYA_TARGET_Y))
         screen.blit(img, rect)
 
-    # overlays (flash, blackout, invert)
-    if effects["flash"] > 0:
-        alpha = int(200 * min(1.0,effects["flash"]))
-        s = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
-        s.fill((255,60,60,alpha))
-        screen.blit(s, (0,0))
-    if effects["blackout"] > 0:
-        s = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
-        s.fill((0,0,0,int(220*min(1.0,effects["blackout"]))))
-        screen.blit(s, (0,0))
-    if effects["invert"] > 0:
-        s = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
-        s.fill((180,180,255,int(90*min(1.0,effects["invert"]))))
-        screen.blit(s, (0,0))
+    # overlays (flash, blackout, invert) — reuse the preallocated surfaces
+    flash_rem = effect_remaining(Eff.FLASH, tnow) if fx else 0.0
+    if flash_rem > 0:
+        OVERLAY_FLASH.set_alpha(int(200 * min(1.0, flash_rem)))
+        screen.blit(OVERLAY_FLASH, (0,0))
+    if blackout_alpha > 0:
+        OVERLAY_BLACKOUT.set_alpha(blackout_alpha)
+        screen.blit(OVERLAY_BLACKOUT, (0,0))
+    invert_rem = effect_remaining(Eff.INVERT, tnow) if fx else 0.0
+    if invert_rem > 0:
+        OVERLAY_INVERT.set_alpha(int(90 * min(1.0, invert_rem)))
+        screen.blit(OVERLAY_INVERT, (0,0))
 
     # show prep countdown near center if within prep
-    if 'prep_end_time' in globals() and prep_end_time and now_s() < prep_end_time:
-        remain = max(0.0, prep_end_time - now_s())
+    if state.prep_end_time and tnow < state.prep_end_time:
+        remain = max(0.0, state.prep_end_time - tnow)
         txt = f"Start in {int(math.ceil(remain))}"
         draw_outlined_text(txt, FONT_LG, (255,255,255), (0,0,0), (WIDTH//2, HEIGHT//2 - 40), outline_width=2)
 
     # show new gimmick notification (bottom-right) with white background and bold text if timer active
-    if new_gimmick_timer > 0:
+    if tnow < state.new_gimmick_end:
         txt = "新しい異変が発現しました。"
-        # draw white rect + bold text (so it doesn't persist beyond timer)
+        # draw white rect + bold text (so it doesn't persist beyond its window)
         draw_bold_on_white(txt, FONT_BOLD, (200,30,30), (WIDTH - 12, HEIGHT - 12))
 
     pygame.display.flip()
 
-def render_gameover():
-    draw_frame_bg()
-    draw_outlined_text("GAME OVER", FONT_LG, (255,200,200), (0,0,0), (WIDTH//2, HEIGHT//2 - 120), outline_width=2)
-    draw_outlined_text("殺されてしまった…", FONT_MD, (255,120,120), (0,0,0), (WIDTH//2, HEIGHT//2 - 60), outline_width=1)
+def _build_gameover_surface():
+    surf = pygame.Surface((WIDTH, HEIGHT))
+    surf.blit(BG_IMG, (0,0))
+    draw_outlined_text("GAME OVER", FONT_LG, (255,200,200), (0,0,0), (WIDTH//2, HEIGHT//2 - 120), outline_width=2, dest=surf)
+    draw_outlined_text("殺されてしまった…", FONT_MD, (255,120,120), (0,0,0), (WIDTH//2, HEIGHT//2 - 60), outline_width=1, dest=surf)
     # Buttons: Restart | Settings | Title
-    bx = WIDTH//2 - 300
-    by = HEIGHT//2 + 40
-    w = 160; h = 56; gap = 40
-    r1 = pygame.Rect(bx, by, w, h)
-    r2 = pygame.Rect(bx + (w + gap), by, w, h)
-    r3 = pygame.Rect(bx + 2*(w + gap), by, w, h)
-    pygame.draw.rect(screen, (255,255,255), r1, border_radius=8)
-    draw_outlined_text("Restart", FONT_MD, (0,0,0), (255,255,255), r1.center, outline_width=1)
-    pygame.draw.rect(screen, (200,200,200), r2, border_radius=8)
-    draw_outlined_text("Settings", FONT_MD, (0,0,0), (200,200,200), r2.center, outline_width=1)
-    pygame.draw.rect(screen, (220,220,220), r3, border_radius=8)
-    draw_outlined_text("Title", FONT_MD, (0,0,0), (220,220,220), r3.center, outline_width=1)
+    pygame.draw.rect(surf, (255,255,255), GAMEOVER_R1, border_radius=8)
+    draw_outlined_text("Restart", FONT_MD, (0,0,0), (255,255,255), GAMEOVER_R1.center, outline_width=1, dest=surf)
+    pygame.draw.rect(surf, (200,200,200), GAMEOVER_R2, border_radius=8)
+    draw_outlined_text("Settings", FONT_MD, (0,0,0), (200,200,200), GAMEOVER_R2.center, outline_width=1, dest=surf)
+    pygame.draw.rect(surf, (220,220,220), GAMEOVER_R3, border_radius=8)
+    draw_outlined_text("Title", FONT_MD, (0,0,0), (220,220,220), GAMEOVER_R3.center, outline_width=1, dest=surf)
+    return surf.convert()
+
+def render_gameover():
+    global _GAMEOVER_SURF
+    if _GAMEOVER_SURF is None:
+        _GAMEOVER_SURF = _build_gameover_surface()
+    screen.blit(_GAMEOVER_SURF, (0,0))
     pygame.display.flip()
 
+def _build_clear_surface():
+    surf = pygame.Surface((WIDTH, HEIGHT))
+    surf.blit(BG_IMG, (0,0))
+    draw_outlined_text("CLEAR!", FONT_LG, (120,220,240), (0,0,0), (WIDTH//2, HEIGHT//2 - 60), outline_width=2, dest=surf)
+    draw_outlined_text("お経を終えた…", FONT_MD, (160,220,240), (0,0,0), (WIDTH//2, HEIGHT//2), outline_width=1, dest=surf)
+    return surf.convert()
+
 def render_clear():
-    draw_frame_bg()
-    draw_outlined_text("CLEAR!", FONT_LG, (120,220,240), (0,0,0), (WIDTH//2, HEIGHT//2 - 60), outline_width=2)
-    draw_outlined_text("お経を終えた…", FONT_MD, (160,220,240), (0,0,0), (WIDTH//2, HEIGHT//2), outline_width=1)
+    global _CLEAR_SURF
+    if _CLEAR_SURF is None:
+        _CLEAR_SURF = _build_clear_surface()
+    screen.blit(_CLEAR_SURF, (0,0))
     pygame.display.flip()
 
 def draw_frame_bg():
     screen.fill((0,0,0))
     screen.blit(BG_IMG, (0,0))
 
-# ----------------- Main loop -----------------
+# ----------------- Scene dispatch -----------------
 DIFFICULTY_JUDGEPOS = "bottom"
-running = True
-show_gimmicks_panel = False
-
-# Ensure initial globals
-start_time_s = None
-next_beat_time = None
-spawn_index = 0
-spawned_target_times = set()
-note_spawn_counter = 0
-prep_end_time = None
-
-while running:
-    dt = clock.tick(FPS) / 1000.0
-    tnow = now_s()
 
-    # Event handling
-    for ev in pygame.event.get():
-        if ev.type == pygame.QUIT:
-            running = False
-
-        elif ev.type == pygame.MOUSEBUTTONDOWN and ev.button == 1:
-            mx,my = ev.pos
-            if scene == SCENE_START:
-                # Start button (left), Settings (center), Gimmicks (right)
-                srect = pygame.Rect(WIDTH//2 - 160, HEIGHT//2 - 40, 140, 64)
-                crect = pygame.Rect(WIDTH//2 - 70, HEIGHT//2 - 40, 140, 64)
-                gimm_rect = pygame.Rect(WIDTH//2 + 20 + 80, HEIGHT//2 - 40, 140, 64)
-                if srect.collidepoint((mx,my)):
-                    notes.clear(); combo=0; misses=0; hannya_visible=False; hannya_hidden_behind=False
-                    start_time_s = now_s()
-                    prep_end_time = start_time_s + START_PREP_DELAY
-                    next_beat_time = prep_end_time + offset_seconds
-                    spawn_index = 0; spawned_target_times.clear()
-                    note_spawn_counter = 0
-                    judge_text=""; judge_time_end=0
-                    show_gimmicks_panel = False
-                    if BGM: play_bgm_once()
-                    scene = SCENE_GAME
-                elif crect.collidepoint((mx,my)):
-                    scene = SCENE_SETTINGS
-                elif gimm_rect.collidepoint((mx,my)):
-                    show_gimmicks_panel = not show_gimmicks_panel
-
-            elif scene == SCENE_SETTINGS:
-                # Done button region
-                done_rect = pygame.Rect(WIDTH//2 - 70, HEIGHT//2 + 140, 140, 48)
-                # Yakubi checkbox area
-                checkbox_rect = pygame.Rect(WIDTH//2 - 140, 320, 20, 20)
-                if done_rect.collidepoint((mx,my)):
-                    scene = SCENE_START
-                elif checkbox_rect.collidepoint((mx,my)):
-                    yakubi_mode = not yakubi_mode
-
-            elif scene == SCENE_GAME:
-                # Click on mokugyo
-                mok_rect = MOKUGYO_IMG.get_rect(center=(LANE_X - 30, MOKUGYO_CENTER[1]))
-                if mok_rect.collidepoint((mx,my)):
-                    hit_check()
-
-            elif scene == SCENE_GAMEOVER:
-                # buttons: Restart | Settings | Title
-                bx = WIDTH//2 - 300; by = HEIGHT//2 + 40; w=160; h=56; gap=40
-                r1 = pygame.Rect(bx, by, w, h)
-                r2 = pygame.Rect(bx + (w + gap), by, w, h)
-                r3 = pygame.Rect(bx + 2*(w + gap), by, w, h)
-                if r1.collidepoint((mx,my)):
-                    # Restart
-                    notes.clear(); combo=0; misses=0; hannya_visible=False; hannya_hidden_behind=False
-                    start_time_s = now_s(); prep_end_time = start_time_s + START_PREP_DELAY
-                    next_beat_time = prep_end_time + offset_seconds
-                    spawn_index = 0; spawned_target_times.clear()
-                    note_spawn_counter = 0
-                    if BGM: play_bgm_once()
-                    scene = SCENE_GAME
-                elif r2.collidepoint((mx,my)):
-                    scene = SCENE_SETTINGS
-                elif r3.collidepoint((mx,my)):
-                    scene = SCENE_START
-
-            elif scene == SCENE_CLEAR:
-                # Restart same as gameover restart
-                bx = WIDTH//2 - 300; by = HEIGHT//2 + 40; w=160; h=56; gap=40
-                r1 = pygame.Rect(bx, by, w, h)
-                r2 = pygame.Rect(bx + (w + gap), by, w, h)
-                r3 = pygame.Rect(bx + 2*(w + gap), by, w, h)
-                if r1.collidepoint((mx,my)):
-                    notes.clear(); combo=0; misses=0; hannya_visible=False; hannya_hidden_behind=False
-                    start_time_s = now_s(); prep_end_time = start_time_s + START_PREP_DELAY
-                    next_beat_time = prep_end_time + offset_seconds
-                    spawn_index = 0; spawned_target_times.clear()
-                    note_spawn_counter = 0
-                    if BGM: play_bgm_once()
-                    scene = SCENE_GAME
-                elif r2.collidepoint((mx,my)):
-                    scene = SCENE_SETTINGS
-                elif r3.collidepoint((mx,my)):
-                    scene = SCENE_START
-
-        elif ev.type == pygame.KEYDOWN:
-            if scene == SCENE_START:
-                if ev.key in (pygame.K_RETURN, pygame.K_KP_ENTER):
-                    notes.clear(); combo=0; misses=0; hannya_visible=False; hannya_hidden_behind=False
-                    start_time_s = now_s(); prep_end_time = start_time_s + START_PREP_DELAY
-                    next_beat_time = prep_end_time + offset_seconds
-                    spawn_index = 0; spawned_target_times.clear()
-                    note_spawn_counter = 0
-                    judge_text=""; judge_time_end=0
-                    if BGM: play_bgm_once()
-                    scene = SCENE_GAME
-                elif ev.key == pygame.K_s:
-                    scene = SCENE_SETTINGS
-                elif ev.key == pygame.K_g:
-                    show_gimmicks_panel = not show_gimmicks_panel
-
-            elif scene == SCENE_SETTINGS:
-                if ev.key == pygame.K_ESCAPE:
-                    scene = SCENE_START
-                elif ev.key == pygame.K_LEFT:
-                    if DIFFICULTY == "normal": DIFFICULTY = "easy"
-                    elif DIFFICULTY == "hard": DIFFICULTY = "normal"
-                elif ev.key == pygame.K_RIGHT:
-                    if DIFFICULTY == "easy": DIFFICULTY = "normal"
-                    elif DIFFICULTY == "normal": DIFFICULTY = "hard"
-                elif ev.key in (pygame.K_UP, pygame.K_DOWN):
-                    DIFFICULTY_JUDGEPOS = "top" if DIFFICULTY_JUDGEPOS == "bottom" else "bottom"
-                elif ev.key == pygame.K_LEFTBRACKET:
-                    offset_seconds -= 0.02
-                elif ev.key == pygame.K_RIGHTBRACKET:
-                    offset_seconds += 0.02
-                elif ev.key in (pygame.K_RETURN, pygame.K_KP_ENTER):
-                    scene = SCENE_START
-                elif ev.key == pygame.K_y:  # quick toggle yakubi with 'y'
-                    yakubi_mode = not yakubi_mode
-
-            elif scene == SCENE_GAME:
-                if ev.key == pygame.K_SPACE:
-                    hit_check()
-
-            elif scene in (SCENE_GAMEOVER, SCENE_CLEAR):
-                if ev.key in (pygame.K_RETURN, pygame.K_KP_ENTER):
-                    notes.clear(); combo=0; misses=0; hannya_visible=False; hannya_hidden_behind=False
-                    start_time_s = now_s(); prep_end_time = start_time_s + START_PREP_DELAY
-                    next_beat_time = prep_end_time + offset_seconds
-                    spawn_index = 0; spawned_target_times.clear()
-                    note_spawn_counter = 0
-                    if BGM: play_bgm_once()
-                    scene = SCENE_GAME
-                elif ev.key == pygame.K_s:
-                    scene = SCENE_SETTINGS
-
-    # Tick down effect timers & new gimmick timer
-    for k in list(effects.keys()):
-        if effects[k] > 0:
-            effects[k] = max(0.0, effects[k] - dt)
-    if new_gimmick_timer > 0:
-        new_gimmick_timer = max(0.0, new_gimmick_timer - dt)
-
-    # Scenes
-    if scene == SCENE_START:
-        render_start(show_gimmicks_panel)
-        continue
-
-    if scene == SCENE_SETTINGS:
-        render_settings()
-        continue
-
-    if scene == SCENE_GAME:
-        # If still in prep delay, show countdown but don't spawn notes until prep_end_time
-        if 'prep_end_time' in globals() and prep_end_time and now_s() < prep_end_time:
-            # simply render game status with countdown
-            render_game()
-            continue
+def reset_and_start_game(frame_now):
+    """(Re)start a run: clear state, arm the beat clock, kick off BGM."""
+    for n in state.notes:
+        if n.dummy:
+            _dummy_pool.append(n)
+    state.notes.clear(); state.combo=0; state.misses=0; state.hannya_visible=False; state.hannya_hidden_behind=False
+    state.game_over_pending = False
+    state.start_time_s = frame_now
+    state.prep_end_time = state.start_time_s + START_PREP_DELAY
+    state.next_beat_time = state.prep_end_time + offset_seconds
+    state.spawn_index = 0
+    state.note_spawn_counter = 0
+    state.judge_text=""; state.judge_time_end=0
+    if BGM: play_bgm_once(frame_now)
+    if BGM_LENGTH:
+        # one-shot timer that flips to CLEAR when the song (plus prep) ends
+        pygame.time.set_timer(EV_BGM_END, int((BGM_LENGTH + START_PREP_DELAY) * 1000), loops=1)
+    enter_scene(SCENE_GAME)
+
+def _handle_start_event(ev, frame_now):
+    if ev.type == pygame.MOUSEBUTTONDOWN and ev.button == 1:
+        # Start button (left), Settings (center), Gimmicks (right)
+        if START_SRECT.collidepoint(ev.pos):
+            state.show_gimmicks_panel = False
+            reset_and_start_game(frame_now)
+        elif START_CRECT.collidepoint(ev.pos):
+            enter_scene(SCENE_SETTINGS)
+        elif START_GIMM_RECT.collidepoint(ev.pos):
+            state.show_gimmicks_panel = not state.show_gimmicks_panel
+    elif ev.type == pygame.KEYDOWN:
+        if ev.key in (pygame.K_RETURN, pygame.K_KP_ENTER):
+            reset_and_start_game(frame_now)
+        elif ev.key == pygame.K_s:
+            enter_scene(SCENE_SETTINGS)
+        elif ev.key == pygame.K_g:
+            state.show_gimmicks_panel = not state.show_gimmicks_panel
+
+# Settings inputs are coalesced per frame: the handler only accumulates a
+# signed difficulty delta and toggle parities, and the tick applies them in
+# one pass — a burst of repeats collapses into at most one state change and
+# one judgement-window refresh per frame.
+_pending_diff_delta = 0
+_pending_judgepos_flips = 0
+_pending_yakubi_flips = 0
+
+_DIFF_ORDER = ("easy", "normal", "hard")
+
+# slowmo visual ramp: exponential approach rate (per second of wall time)
+_SLOWMO_RAMP_RATE = 0.6
+
+def _apply_settings_changes():
+    global DIFFICULTY, DIFFICULTY_JUDGEPOS, yakubi_mode
+    global _pending_diff_delta, _pending_judgepos_flips, _pending_yakubi_flips
+    if _pending_diff_delta:
+        i = clamp(_DIFF_ORDER.index(DIFFICULTY) + _pending_diff_delta, 0, 2)
+        if _DIFF_ORDER[i] != DIFFICULTY:
+            DIFFICULTY = _DIFF_ORDER[i]
+            refresh_judgement_windows()
+        _pending_diff_delta = 0
+    if _pending_judgepos_flips:
+        if _pending_judgepos_flips & 1:
+            DIFFICULTY_JUDGEPOS = "top" if DIFFICULTY_JUDGEPOS == "bottom" else "bottom"
+        _pending_judgepos_flips = 0
+    if _pending_yakubi_flips:
+        if _pending_yakubi_flips & 1:
+            yakubi_mode = not yakubi_mode
+        _pending_yakubi_flips = 0
+
+def _handle_settings_event(ev, frame_now):
+    global _pending_diff_delta, _pending_judgepos_flips, _pending_yakubi_flips
+    if ev.type == pygame.MOUSEBUTTONDOWN and ev.button == 1:
+        if SETTINGS_DONE_RECT.collidepoint(ev.pos):
+            _apply_settings_changes()  # don't strand same-frame changes
+            enter_scene(SCENE_START)
+        elif SETTINGS_CHECKBOX_RECT.collidepoint(ev.pos):
+            _pending_yakubi_flips += 1
+    elif ev.type == pygame.KEYDOWN:
+        if ev.key in (pygame.K_ESCAPE, pygame.K_RETURN, pygame.K_KP_ENTER):
+            _apply_settings_changes()
+            enter_scene(SCENE_START)
+        elif ev.key == pygame.K_LEFT:
+            _pending_diff_delta -= 1
+        elif ev.key == pygame.K_RIGHT:
+            _pending_diff_delta += 1
+        elif ev.key in (pygame.K_UP, pygame.K_DOWN):
+            _pending_judgepos_flips += 1
+        elif ev.key == pygame.K_y:  # quick toggle yakubi with 'y'
+            _pending_yakubi_flips += 1
+
+def _handle_game_event(ev, frame_now):
+    if ev.type == EV_BGM_END:
+        # song finished -> CLEAR
+        stop_bgm()
+        play_bgm_soft_loop()
+        enter_scene(SCENE_CLEAR)
+    elif ev.type == pygame.MOUSEBUTTONDOWN and ev.button == 1:
+        # Click on mokugyo
+        if MOK_RECT.collidepoint(ev.pos):
+            hit_check(frame_now)
+    elif ev.type == pygame.KEYDOWN and ev.key == pygame.K_SPACE:
+        hit_check(frame_now)
+
+def _handle_end_event(ev, frame_now):
+    # gameover and clear share the Restart | Settings | Title layout
+    if ev.type == pygame.MOUSEBUTTONDOWN and ev.button == 1:
+        if GAMEOVER_R1.collidepoint(ev.pos):
+            reset_and_start_game(frame_now)
+        elif GAMEOVER_R2.collidepoint(ev.pos):
+            enter_scene(SCENE_SETTINGS)
+        elif GAMEOVER_R3.collidepoint(ev.pos):
+            enter_scene(SCENE_START)
+    elif ev.type == pygame.KEYDOWN:
+        if ev.key in (pygame.K_RETURN, pygame.K_KP_ENTER):
+            reset_and_start_game(frame_now)
+        elif ev.key == pygame.K_s:
+            enter_scene(SCENE_SETTINGS)
+
+def _tick_start(frame_now, dt):
+    render_start(state.show_gimmicks_panel)
+
+# offset change per second while a bracket key is held (the old discrete
+# step was 0.02 per auto-repeat event; this sweeps smoothly instead)
+_OFFSET_SWEEP_PER_SEC = 0.3
+
+def _tick_settings(frame_now, dt):
+    global offset_seconds
+    _apply_settings_changes()
+    # sample held keys once per frame instead of draining an auto-repeat
+    # event burst: work per frame is bounded regardless of repeat rate
+    keys = pygame.key.get_pressed()
+    if keys[pygame.K_LEFTBRACKET]:
+        offset_seconds -= _OFFSET_SWEEP_PER_SEC * dt
+    elif keys[pygame.K_RIGHTBRACKET]:
+        offset_seconds += _OFFSET_SWEEP_PER_SEC * dt
+    render_settings()
+
+def _tick_game(frame_now, dt):
+    # --- phase 2: simulation (also during prep: notes pre-spawn so the
+    # first beat lands exactly at prep end) ---
+    if state.next_beat_time:
+        schedule_notes_up_to(frame_now)
+
+    # update slowmo visual (does not change timing); the ramp integrates
+    # exactly over the real frame delta, so it lands at the same value per
+    # wall-clock second whatever the render rate does
+    fx = any_effect_active(frame_now)
+    state.slowmo_target = 0.55 if (fx and effect_active(Eff.SLOWMO, frame_now)) else 1.0
+    state.slowmo_current += (state.slowmo_target - state.slowmo_current) * (1.0 - math.exp(-_SLOWMO_RAMP_RATE * dt))
+
+    # update notes and drop timed-out ones in one pass (slice-assign so
+    # external references to `notes` stay valid)
+    update_notes(frame_now)
+    survivors = []
+    for n in state.notes:
+        if n.dead:
+            if n.dummy:
+                _dummy_pool.append(n)  # recycle instead of leaving it to the GC
+            if not n.hit:
+                register_auto_miss(frame_now)
+        else:
+            survivors.append(n)
+    state.notes[:] = survivors
+
+    # spawn dummy notes when spawn_rush is active
+    if fx and effect_active(Eff.SPAWN_RUSH, frame_now):
+        if not state.dummy_spawn_deadline:
+            state.dummy_spawn_deadline = frame_now + random.expovariate(_DUMMY_SPAWN_RATE)
+        elif frame_now >= state.dummy_spawn_deadline:
+            spawn_dummy_note(frame_now + NOTE_TRAVEL_SEC*0.5)
+            state.dummy_spawn_deadline = frame_now + random.expovariate(_DUMMY_SPAWN_RATE)
+    elif state.dummy_spawn_deadline:
+        state.dummy_spawn_deadline = 0.0
+
+    # Miss limit -> final sequence (the flag is raised at the miss sites,
+    # so the hot path no longer re-derives the limit every frame)
+    if state.game_over_pending:
+        state.game_over_pending = False
+        pygame.time.set_timer(EV_BGM_END, 0)  # cancel the pending clear
+        state.hannya_hidden_behind = True
+        neck_snap_and_gameover()
+        stop_bgm()
+        enter_scene(SCENE_GAMEOVER)
+        render_gameover()
+        return
 
-        # schedule notes up to now
-        if next_beat_time is not None:
-            schedule_notes_up_to(now_s())
-
-        # update notes and remove timed-out
-        for n in list(notes):
-            n.update(now_s())
-            if n.dead:
-                try: notes.remove(n)
-                except: pass
-                register_auto_miss()
-
-        # spawn dummy notes when spawn_rush is active
-        if effects["spawn_rush"] > 0 and random.random() < 0.03:
-            notes.append(Note(target_time=now_s() + NOTE_TRAVEL_SEC*0.5, x=LANE_X, dummy=True))
-
-        # BGM end -> CLEAR
-        if BGM_LENGTH and start_time_s:
-            if now_s() - start_time_s > BGM_LENGTH + START_PREP_DELAY:  # account for prep delay
-                stop_bgm()
-                play_bgm_soft_loop()
-                scene = SCENE_CLEAR
-
-        # Miss limit -> final sequence
-        if misses >= MISS_LIMIT_MAP[DIFFICULTY]:
-            hannya_hidden_behind = True
-            neck_snap_and_gameover()
-            stop_bgm()
-            scene = SCENE_GAMEOVER
-            render_gameover()
-            continue
+    # --- phase 3: render ---
+    render_game(frame_now)
 
-        render_game()
-        continue
+def _tick_gameover(frame_now, dt):
+    render_gameover()
 
-    if scene == SCENE_GAMEOVER:
-        render_gameover()
-        continue
+def _tick_clear(frame_now, dt):
+    render_clear()
 
-    if scene == SCENE_CLEAR:
-        render_clear()
-        continue
+SCENE_EVENT_HANDLERS = {
+    SCENE_START:    _handle_start_event,
+    SCENE_SETTINGS: _handle_settings_event,
+    SCENE_GAME:     _handle_game_event,
+    SCENE_GAMEOVER: _handle_end_event,
+    SCENE_CLEAR:    _handle_end_event,
+}
+
+SCENE_TICK = {
+    SCENE_START:    _tick_start,
+    SCENE_SETTINGS: _tick_settings,
+    SCENE_GAME:     _tick_game,
+    SCENE_GAMEOVER: _tick_gameover,
+    SCENE_CLEAR:    _tick_clear,
+}
+
+# ----------------- Main loop -----------------
+# Simulation here is timestamp-driven rather than accumulator-driven: note
+# positions, scheduling, judgement and effect expiries are all computed from
+# the frame timestamp, so gameplay timing is exact at any render rate and a
+# dropped frame costs nothing but display smoothness. A fixed-timestep
+# accumulator would only re-run the same closed-form updates several times
+# per frame; the lone piece of incremental state (the slowmo ramp) instead
+# integrates exactly over the measured frame delta in _tick_game.
+while state.running:
+    dt = clock.tick(FPS) / 1000.0
+    # single timestamp for the whole frame, captured before any work so
+    # input judgement and simulation all see the same coherent time
+    frame_now = now_s()
+
+    # --- phase 1: poll input ---
+    for ev in pygame.event.get(SCENE_ALLOWED_EVENTS[state.scene]):
+        if ev.type == pygame.QUIT:
+            state.running = False
+        else:
+            SCENE_EVENT_HANDLERS[state.scene](ev, frame_now)
+
+    # --- phases 2+3: per-scene simulate & render ---
+    SCENE_TICK[state.scene](frame_now, dt)
 
 # Cleanup
 pygame.quit()
 sys.exit(0)
+